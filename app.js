@@ -43,6 +43,31 @@ function addMessage(speaker, text, avatarType) {
     
     messagesContainer.appendChild(message);
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    return message;
+}
+
+/**
+ * Reads a server-sent-events response, calling onEvent with each parsed `data:` payload.
+ * @param {Response} response - A fetch response with a text/event-stream body.
+ * @param {function(object): void} onEvent - Receives each decoded event.
+ */
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line; keep any partial event buffered
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        events
+            .filter(e => e.startsWith("data: "))
+            .forEach(e => onEvent(JSON.parse(e.slice(6))));
+    }
 }
 
 /**
@@ -115,28 +140,56 @@ async function submitAction() {
     isProcessing = true;
     submitBtn.disabled = true;
     
+    // NPC replies arrive token by token; show them in a draft message
+    let draft = null;
+    
     try {
-        const response = await fetch(`${BACKEND_URL}/session/action`, {
+        const response = await fetch(`${BACKEND_URL}/session/action/stream`, {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({ session_id: sessionId, text: playerAction })
         });
         
-        const data = await response.json();
-        
         if (response.ok) {
-            // The backend returns an array of reply messages (one or more)
-            data.reply.forEach(m => addMessage(m.speaker, m.text, m.avatar_type));
+            let draftText = "";
+            let finished = false;
             
-            // Update the state (location, clues, etc.)
-            updateStatus(data.state);
+            await readEventStream(response, event => {
+                if (event.error) {
+                    addMessage("System Error", `Action failed: ${event.error}`, "system");
+                    finished = true;
+                    return;
+                }
+                if (event.done) {
+                    // The final event carries the authoritative reply and state
+                    if (draft) draft.remove();
+                    draft = null;
+                    event.reply.forEach(m => addMessage(m.speaker, m.text, m.avatar_type));
+                    updateStatus(event.state);
+                    finished = true;
+                    return;
+                }
+                draftText += event.token;
+                // The first token names the speaker
+                if (!draft) draft = addMessage(event.speaker, "", event.avatar_type);
+                draft.querySelector(".text").textContent = draftText;
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            });
+            
+            if (!finished) {
+                if (draft) draft.remove();
+                addMessage("System Error", "The reply was cut off before it finished. Please try again.", "system");
+                console.error("Action Error: stream ended without a final event");
+            }
         } else {
             // Handle HTTP errors
+            const data = await response.json();
             const errorMessage = data.detail || `Error: ${response.status} ${response.statusText}`;
             addMessage("System Error", `Action failed: ${errorMessage}`, "system");
             console.error("Action Error:", errorMessage);
         }
     } catch (error) {
+        if (draft) draft.remove();
         addMessage("System Error", `Could not reach the server: ${error.message}.`, "system");
         console.error("Fetch Error:", error);
     } finally {
@@ -1,15 +1,27 @@
 import os
-import json
+import re
+import asyncio
 import uuid
 import logging
+import functools
 import hashlib
-from typing import Optional, Dict, List, Tuple, Any
+import statistics
+import time
+import weakref
+import contextlib
+import copy
+from collections import OrderedDict, deque
+from typing import Optional, Dict, List, Set, Tuple, Any, FrozenSet, AsyncIterator, Callable, NamedTuple, Union
 from datetime import datetime
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-import google.generativeai as genai
+from starlette.middleware.gzip import GZipMiddleware
+import anyio
+import httpx
+import orjson
 
 # --- Configuration & Setup ---
 load_dotenv()
@@ -18,14 +30,42 @@ logging.basicConfig(level=logging.INFO)
 MODEL = os.getenv("MODEL", "gemini-2.5-flash-preview-09-2025")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+
 if not GEMINI_API_KEY:
     logging.error("GEMINI_API_KEY is not set.")
-else:
+
+# One pooled HTTP/2 client for every Gemini call, so TLS connections are reused
+http_client = httpx.AsyncClient(
+    base_url=GEMINI_API_BASE,
+    headers={"x-goog-api-key": GEMINI_API_KEY, "Content-Type": "application/json"},
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=100),
+    timeout=30,
+)
+
+# Optional shared store: with REDIS_URL set, sessions and cached replies are
+# shared by every worker; without it everything stays in-process.
+REDIS_URL = os.getenv("REDIS_URL", "")
+RESPONSE_CACHE_TTL = 3600  # seconds
+# How stale a worker's view of the cache generation may get, so a reset on
+# another worker takes up to this long to apply here
+CACHE_GENERATION_REFRESH = 1.0  # seconds
+SESSION_TTL = 86400  # seconds
+# Per-session write lock: it outlives the slowest LLM call, so a crashed
+# worker can't wedge a session, and callers give up after SESSION_LOCK_WAIT
+SESSION_LOCK_TTL_MS = 60_000
+SESSION_LOCK_WAIT = 30  # seconds
+
+redis_client = None
+if REDIS_URL:
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        logging.info("Gemini client configured.")
+        import redis.asyncio as aioredis
+        redis_pool = aioredis.ConnectionPool.from_url(REDIS_URL, max_connections=50)
+        redis_client = aioredis.Redis(connection_pool=redis_pool)
+        logging.info("Redis store configured.")
     except Exception as e:
-        logging.error(f"Failed to configure Gemini client: {e}")
+        logging.error(f"Failed to configure Redis store: {e}")
 
 # --- MYSTERY TRUTH SYSTEM ---
 MYSTERY_TRUTH = {
@@ -100,53 +140,178 @@ MYSTERY_TRUTH = {
     }
 }
 
+def _index_clues_by_suspect() -> Dict[str, FrozenSet[str]]:
+    """Map each suspect to the descriptions of every clue pointing to them."""
+    index: Dict[str, set] = {}
+    for location_clues in MYSTERY_TRUTH["clues"].values():
+        for clue_data in location_clues.values():
+            for suspect in clue_data.get("points_to", []):
+                index.setdefault(suspect, set()).add(clue_data["description"])
+    return {suspect: frozenset(descs) for suspect, descs in index.items()}
+
+# Built once at import so evidence counting is a single set intersection
+SUSPECT_TO_CLUE_DESCS = _index_clues_by_suspect()
+
+# Evidence counts at which build_revelation_logic changes Draco's behaviour
+NERVOUS_THRESHOLD = 2
+CONFESS_THRESHOLD = MYSTERY_TRUTH["npc_knowledge"]["draco"].get("confess_threshold", 3)
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
 # --- RESPONSE CACHE SYSTEM ---
 class ResponseCache:
     """Ensures consistent answers to identical questions."""
     
-    def __init__(self):
-        self.cache: Dict[str, Dict] = {}
+    # Bumped by clear(); kept outside the "response:*" namespace that clear() deletes
+    GENERATION_KEY = "cache:response-generation"
+    
+    def __init__(self, max_entries: int = 4096, redis=None):
+        # In-process L1 of key -> (expires_at, response); oldest entries are
+        # evicted first once max_entries is reached
+        self.cache: "OrderedDict[Tuple[int, str, str, int], Tuple[float, Dict]]" = OrderedDict()
+        self.max_entries = max_entries
+        # Optional shared L2 so every worker sees the same answers
+        self.redis = redis
+        # Part of every key, so a reset on any worker orphans all older entries
+        self.generation = 0
+        self.generation_checked_at = float("-inf")
         self.hits = 0
         self.misses = 0
     
-    def _generate_key(self, npc_key: str, question: str, evidence_count: int) -> str:
+    async def _current_generation(self) -> int:
+        """
+        The cache generation, re-read from Redis at most every
+        CACHE_GENERATION_REFRESH so resets on other workers apply here.
+        """
+        now = time.monotonic()
+        if self.redis is not None and now - self.generation_checked_at >= CACHE_GENERATION_REFRESH:
+            self.generation_checked_at = now
+            try:
+                self.generation = int(await self.redis.get(self.GENERATION_KEY) or 0)
+            except Exception as e:
+                logging.error(f"Redis cache generation read failed: {e}")
+        return self.generation
+    
+    async def _generate_key(self, npc_key: str, question: str, evidence_count: int) -> Tuple[int, str, str, int]:
         """Generate cache key from NPC, question, and evidence state."""
-        # Normalize question
-        q_normalized = question.lower().strip()
-        # Key includes evidence count so answers change as player progresses
-        key_string = f"{npc_key}:{q_normalized}:evidence_{evidence_count}"
-        return hashlib.md5(key_string.encode()).hexdigest()
+        # Key includes the evidence tier so answers change as player progresses.
+        # L1 is in-process, so the tuple itself is the key - no hashing needed.
+        return (
+            await self._current_generation(),
+            npc_key,
+            " ".join(question.lower().split()),
+            self._evidence_bucket(evidence_count),
+        )
+    
+    @staticmethod
+    def _evidence_bucket(evidence_count: int) -> int:
+        """Collapse evidence counts that get the same revelation logic."""
+        if evidence_count < NERVOUS_THRESHOLD:
+            return 0
+        return min(evidence_count, CONFESS_THRESHOLD)
     
-    def get(self, npc_key: str, question: str, evidence_count: int) -> Optional[Dict]:
+    def _redis_key(self, key: Tuple[int, str, str, int]) -> str:
+        generation, npc_key, q_normalized, evidence_count = key
+        digest = hashlib.blake2b(f"{generation}:{npc_key}:{q_normalized}:{evidence_count}".encode(), digest_size=8).hexdigest()
+        return f"response:{npc_key}:{digest}"
+    
+    def _remember(self, key: Tuple[int, str, str, int], response: Dict, ttl: float = RESPONSE_CACHE_TTL):
+        self.cache[key] = (time.monotonic() + min(ttl, RESPONSE_CACHE_TTL), response)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+    
+    async def _fetch(self, key: Tuple[int, str, str, int]) -> Optional[Dict]:
+        """Look a key up in L1, then in Redis (promoting hits into L1)."""
+        entry = self.cache.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at > time.monotonic():
+                self.cache.move_to_end(key)
+                return response
+            del self.cache[key]
+        if self.redis is None:
+            return None
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(self._redis_key(key))
+                pipe.pttl(self._redis_key(key))
+                raw, ttl_ms = await pipe.execute()
+        except Exception as e:
+            logging.error(f"Redis cache read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        response = orjson.loads(raw)
+        # Expire the L1 copy when Redis expires the original
+        self._remember(key, response, ttl_ms / 1000 if ttl_ms > 0 else RESPONSE_CACHE_TTL)
+        return response
+    
+    async def get(self, npc_key: str, question: str, evidence_count: int) -> Optional[Dict]:
         """Get cached response if exists."""
-        key = self._generate_key(npc_key, question, evidence_count)
-        if key in self.cache:
+        response = await self._fetch(await self._generate_key(npc_key, question, evidence_count))
+        if response is not None:
             self.hits += 1
             logging.info(f"Cache HIT for {npc_key} (hit rate: {self.get_hit_rate():.1%})")
-            return self.cache[key]
+            return response
         self.misses += 1
         return None
     
-    def set(self, npc_key: str, question: str, evidence_count: int, response: Dict):
+    async def contains(self, npc_key: str, question: str, evidence_count: int) -> bool:
+        """Check for a cached response without touching hit/miss stats."""
+        return await self._fetch(await self._generate_key(npc_key, question, evidence_count)) is not None
+    
+    async def set(self, npc_key: str, question: str, evidence_count: int, response: Dict):
         """Cache a response."""
-        key = self._generate_key(npc_key, question, evidence_count)
-        self.cache[key] = response
+        key = await self._generate_key(npc_key, question, evidence_count)
+        self._remember(key, response)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self._redis_key(key), orjson.dumps(response), ex=RESPONSE_CACHE_TTL)
+            except Exception as e:
+                logging.error(f"Redis cache write failed: {e}")
         logging.info(f"Cached response for {npc_key}")
     
+    async def clear(self):
+        """Drop every cached response on every worker and reset hit/miss counters."""
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+        self.generation += 1
+        if self.redis is not None:
+            try:
+                # Other workers pick up the new generation within CACHE_GENERATION_REFRESH
+                self.generation = await self.redis.incr(self.GENERATION_KEY)
+                self.generation_checked_at = time.monotonic()
+                keys = [key async for key in self.redis.scan_iter(match="response:*")]
+                if keys:
+                    await self.redis.delete(*keys)
+            except Exception as e:
+                logging.error(f"Redis cache clear failed: {e}")
+    
     def get_hit_rate(self) -> float:
         total = self.hits + self.misses
         return self.hits / total if total > 0 else 0.0
     
+    def cache_info(self) -> CacheInfo:
+        """L1 statistics in the shape of functools.lru_cache's cache_info()."""
+        return CacheInfo(self.hits, self.misses, self.max_entries, len(self.cache))
+    
     def get_stats(self) -> Dict:
+        info = self.cache_info()
         return {
-            "cache_hits": self.hits,
-            "cache_misses": self.misses,
+            "cache_hits": info.hits,
+            "cache_misses": info.misses,
             "hit_rate": self.get_hit_rate(),
-            "cached_entries": len(self.cache)
+            "cached_entries": info.currsize
         }
 
 # Global cache instance
-response_cache = ResponseCache()
+response_cache = ResponseCache(redis=redis_client)
 
 # --- EVALUATION FRAMEWORK ---
 class EvaluationMetrics:
@@ -203,18 +368,20 @@ class EvaluationMetrics:
         consistency_score = 1 - (errors / self.total_interactions)
         return max(0.0, consistency_score)
     
-    def calculate_quality_score(self) -> float:
-        """Test → Measurement → Metric: Response Quality."""
+    def average_scores(self) -> Tuple[float, float]:
+        """Measurement: average coherence and relevance (5.0 each before any interaction)."""
         if not self.coherence_scores:
-            return 1.0
-        
-        # Measurement: Average scores
-        avg_coherence = sum(self.coherence_scores) / len(self.coherence_scores)
-        avg_relevance = sum(self.relevance_scores) / len(self.relevance_scores)
-        
+            return 5.0, 5.0
+        return statistics.fmean(self.coherence_scores), statistics.fmean(self.relevance_scores)
+    
+    @staticmethod
+    def quality_from_averages(avg_coherence: float, avg_relevance: float) -> float:
         # Metric: Normalize to 0-1 scale
-        quality_score = (avg_coherence + avg_relevance) / 10  # Both out of 5, so /10
-        return quality_score
+        return (avg_coherence + avg_relevance) / 10  # Both out of 5, so /10
+    
+    def calculate_quality_score(self) -> float:
+        """Test → Measurement → Metric: Response Quality."""
+        return self.quality_from_averages(*self.average_scores())
     
     def calculate_progression_score(self) -> float:
         """Test → Measurement → Metric: Mystery Progression."""
@@ -228,18 +395,29 @@ class EvaluationMetrics:
         progression_score = 1 - premature_rate
         return max(0.0, progression_score)
     
+    @staticmethod
+    def combine_scores(consistency: float, quality: float, progression: float) -> float:
+        # Weighted average: consistency=40%, quality=30%, progression=30%
+        return (consistency * 0.4) + (quality * 0.3) + (progression * 0.3)
+    
     def calculate_overall_accuracy(self) -> float:
         """Weighted combination of all metrics."""
-        consistency = self.calculate_consistency_score()
-        quality = self.calculate_quality_score()
-        progression = self.calculate_progression_score()
-        
-        # Weighted average: consistency=40%, quality=30%, progression=30%
-        overall = (consistency * 0.4) + (quality * 0.3) + (progression * 0.3)
-        return overall
+        return self.combine_scores(
+            self.calculate_consistency_score(),
+            self.calculate_quality_score(),
+            self.calculate_progression_score()
+        )
     
     def generate_report(self) -> Dict:
         """Generate full evaluation report."""
+        # Each metric is computed once and reused for its score and pass flag
+        consistency = self.calculate_consistency_score()
+        avg_coherence, avg_relevance = self.average_scores()
+        quality = self.quality_from_averages(avg_coherence, avg_relevance)
+        progression = self.calculate_progression_score()
+        overall = self.combine_scores(consistency, quality, progression)
+        total_errors = self.knowledge_violations + self.hallucinated_locations + self.hallucinated_npcs
+        
         return {
             "timestamp": datetime.now().isoformat(),
             "total_interactions": self.total_interactions,
@@ -250,25 +428,25 @@ class EvaluationMetrics:
                     "knowledge_violations": self.knowledge_violations,
                     "hallucinated_locations": self.hallucinated_locations,
                     "hallucinated_npcs": self.hallucinated_npcs,
-                    "total_errors": self.knowledge_violations + self.hallucinated_locations + self.hallucinated_npcs
+                    "total_errors": total_errors
                 },
                 "metric": {
-                    "consistency_score": round(self.calculate_consistency_score(), 3),
+                    "consistency_score": round(consistency, 3),
                     "pass_threshold": 0.90,
-                    "passed": self.calculate_consistency_score() >= 0.90
+                    "passed": consistency >= 0.90
                 }
             },
             
             "response_quality": {
                 "test": "response_coherence_test + relevance_test",
                 "measurements": {
-                    "avg_coherence": round(sum(self.coherence_scores) / len(self.coherence_scores), 2) if self.coherence_scores else 5.0,
-                    "avg_relevance": round(sum(self.relevance_scores) / len(self.relevance_scores), 2) if self.relevance_scores else 5.0,
+                    "avg_coherence": round(avg_coherence, 2),
+                    "avg_relevance": round(avg_relevance, 2),
                 },
                 "metric": {
-                    "quality_score": round(self.calculate_quality_score(), 3),
+                    "quality_score": round(quality, 3),
                     "pass_threshold": 0.75,
-                    "passed": self.calculate_quality_score() >= 0.75
+                    "passed": quality >= 0.75
                 }
             },
             
@@ -279,16 +457,16 @@ class EvaluationMetrics:
                     "premature_rate": round(self.premature_revelations / self.total_interactions, 3) if self.total_interactions > 0 else 0
                 },
                 "metric": {
-                    "progression_score": round(self.calculate_progression_score(), 3),
+                    "progression_score": round(progression, 3),
                     "pass_threshold": 0.80,
-                    "passed": self.calculate_progression_score() >= 0.80
+                    "passed": progression >= 0.80
                 }
             },
             
             "overall": {
-                "accuracy": round(self.calculate_overall_accuracy(), 3),
+                "accuracy": round(overall, 3),
                 "pass_threshold": 0.80,
-                "passed": self.calculate_overall_accuracy() >= 0.80
+                "passed": overall >= 0.80
             },
             
             "cache_performance": response_cache.get_stats()
@@ -314,19 +492,11 @@ Output ONLY valid JSON with these keys:
 - "thinking": brief reasoning for your response (for debugging)
 """
 
-llm_model = None
-try:
-    llm_model = genai.GenerativeModel(
-        model_name=MODEL, 
-        system_instruction=SYSTEM_INSTRUCTION_BASE
-    )
-    logging.info(f"LLM model prepared: {MODEL}")
-except Exception as e:
-    logging.error(f"Could not instantiate GenerativeModel: {e}")
+# Static parts of every generateContent request, built once
+SYSTEM_INSTRUCTION = {"parts": [{"text": SYSTEM_INSTRUCTION_BASE}]}
+GENERATION_CONFIG = {"responseMimeType": "application/json"}
 
 # --- Game Data ---
-SESSIONS: Dict[str, Dict] = {}
-
 LOCATIONS = {
     "great hall": {
         "display": "The Great Hall",
@@ -346,6 +516,19 @@ LOCATIONS = {
     },
 }
 
+# Typed destination -> LOCATIONS key ("library", "the library", ...)
+LOCATION_ALIASES: Dict[str, str] = {
+    alias: key
+    for key, loc in LOCATIONS.items()
+    for alias in (key, loc["display"].lower())
+}
+
+# Per-location clue lookup; ids are also reachable with spaces ("torn page")
+CLUE_ALIASES: Dict[str, Dict[str, Dict]] = {
+    location: {clue_id.replace("_", " "): clue_data for clue_id, clue_data in location_clues.items()}
+    for location, location_clues in MYSTERY_TRUTH["clues"].items()
+}
+
 NPCS = {
     "professor dumbledore": {
         "display": "Professor Dumbledore",
@@ -367,11 +550,41 @@ NPCS = {
     },
 }
 
+# Fixed speaker/avatar part of every reply message; only "text" varies
+NPC_MSG_TEMPLATE: Dict[str, Dict[str, str]] = {
+    npc_key: {"speaker": npc_data["display"], "avatar_type": npc_data["avatar"]}
+    for npc_key, npc_data in NPCS.items()
+}
+NARRATOR_TEMPLATE = {"speaker": "Narrator", "avatar_type": "brown"}
+
+# Flat alias table: alias -> (npc_key, display)
+ALIAS_TO_NPC: Dict[str, Tuple[str, str]] = {
+    alias: (npc_key, npc_data["display"])
+    for npc_key, npc_data in NPCS.items()
+    for alias in npc_data.get("aliases", [npc_key])
+}
+# Whole-word alias match; longest first so "draco malfoy" wins over "draco"
+ALIAS_RE = re.compile(
+    r"\b(?:{})\b".format("|".join(re.escape(alias) for alias in sorted(ALIAS_TO_NPC, key=len, reverse=True))),
+    re.IGNORECASE
+)
+
 # --- Pydantic Models ---
 class Action(BaseModel):
     session_id: str
     text: str
 
+class WarmCacheRequest(BaseModel):
+    session_id: str
+    # Exact player texts, e.g. "talk to dumbledore: any hints?"; replies are
+    # cached under the text itself, so only the forms players type will hit
+    texts: List[str]
+
+# Every uncached text costs one LLM call, so a single warm-up is bounded
+WARM_CACHE_MAX_TEXTS = 50
+
+# Response models only feed the OpenAPI schema (via `responses=`); handlers
+# return plain dicts, so nothing is validated on the way out
 class Message(BaseModel):
     speaker: str
     text: str
@@ -384,8 +597,40 @@ class State(BaseModel):
     evidence: List[str]
     npcs: Dict[str, Dict]
 
+class StartResponse(BaseModel):
+    session_id: str
+    state: State
+
+class ActionResponse(BaseModel):
+    reply: List[Message]
+    state: State
+
+class BatchItemError(BaseModel):
+    session_id: str
+    detail: str
+
+class SessionStateResponse(BaseModel):
+    session_id: str
+    state: State
+    evidence_against: Dict[str, int]
+
 # --- FastAPI Setup ---
-app = FastAPI(title="Hogwarts Mystery Backend with Evaluation")
+# The health check stays cheap to poll, and gzip would buffer streamed events
+# instead of flushing each one
+UNCOMPRESSED_PATHS = frozenset({"/", "/session/action/stream"})
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """GZip large responses, passing UNCOMPRESSED_PATHS through untouched."""
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in UNCOMPRESSED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app = FastAPI(title="Hogwarts Mystery Backend with Evaluation", default_response_class=ORJSONResponse)
+# Reports and session states grow with play
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=500, compresslevel=5)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -395,76 +640,193 @@ app.add_middleware(
 )
 
 # --- Session Management ---
+HISTORY_TURNS = 5  # Messages of recent conversation injected into NPC prompts
+HISTORY_TURN_CHARS = 240  # Each message is truncated to this in the prompt
+MAX_HISTORY_CHARS = 1000  # Oldest turns are dropped beyond this total
+
+class Session:
+    """State of one game. Slots keep each session small and field access cheap."""
+    
+    __slots__ = (
+        "session_id", "player_name", "location", "clues_found", "timeline", "recent_turns",
+        "evidence", "evidence_set", "evidence_against",
+    )
+    # Fields written to the session store; evidence_set is derived
+    PERSISTED = (
+        "session_id", "player_name", "location", "clues_found", "timeline", "recent_turns",
+        "evidence", "evidence_against",
+    )
+    
+    def __init__(self, session_id: str, player_name: str = "You", location: str = "great hall",
+                 clues_found: int = 0, timeline=(), recent_turns=(), evidence=(),
+                 evidence_against: Optional[Dict[str, int]] = None):
+        self.session_id = session_id
+        self.player_name = player_name
+        self.location = location
+        self.clues_found = clues_found
+        self.timeline = deque(timeline)
+        # Preformatted "speaker: text" lines for the prompt builder
+        self.recent_turns = deque(recent_turns, maxlen=HISTORY_TURNS)
+        self.evidence = list(evidence)
+        # Membership index over evidence; kept in sync by add_evidence
+        self.evidence_set = set(self.evidence)
+        self.evidence_against = evidence_against if evidence_against is not None else {"draco": 0, "evelyn": 0}
+    
+    def to_doc(self) -> Dict:
+        return {name: getattr(self, name) for name in self.PERSISTED}
+
+class SessionStore:
+    """Holds game sessions in-process, or in Redis when one is configured."""
+    
+    def __init__(self, redis=None):
+        self.redis = redis
+        self.sessions: Dict[str, Session] = {}
+        # In-process locks live only while some request holds or awaits them
+        self._local_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+    
+    def _redis_key(self, sid: str) -> str:
+        return f"session:{sid}"
+    
+    def _lock_key(self, sid: str) -> str:
+        return f"session-lock:{sid}"
+    
+    def _dump(self, session: Session) -> bytes:
+        return orjson.dumps(session.to_doc(), default=list)  # deques serialize as lists
+    
+    def _load(self, raw: bytes) -> Session:
+        return Session(**orjson.loads(raw))
+    
+    async def get_session(self, sid: str) -> Optional[Session]:
+        if self.redis is None:
+            return self.sessions.get(sid)
+        # Always read through: another worker may have advanced this session
+        raw = await self.redis.get(self._redis_key(sid))
+        return self._load(raw) if raw is not None else None
+    
+    async def save_session(self, session: Session):
+        if self.redis is None:
+            self.sessions[session.session_id] = session
+            return
+        await self.redis.set(self._redis_key(session.session_id), self._dump(session), ex=SESSION_TTL)
+    
+    async def acquire_lock(self, sid: str) -> Any:
+        """
+        Take the write lock for one session, so load -> run -> save on one
+        worker can't overwrite another's. Pass the result to release_lock.
+        """
+        if self.redis is None:
+            lock = self._local_locks.get(sid)
+            if lock is None:
+                lock = self._local_locks[sid] = asyncio.Lock()
+            await lock.acquire()
+            return lock
+        
+        key, token = self._lock_key(sid), uuid.uuid4().hex.encode()
+        deadline = time.monotonic() + SESSION_LOCK_WAIT
+        while not await self.redis.set(key, token, nx=True, px=SESSION_LOCK_TTL_MS):
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=409, detail="Session is busy.")
+            await asyncio.sleep(0.05)
+        return token
+    
+    async def release_lock(self, sid: str, handle: Any):
+        if self.redis is None:
+            handle.release()
+            return
+        
+        # Compare-and-delete: if our lock expired and another request took it, leave theirs
+        key = self._lock_key(sid)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                if await pipe.get(key) == handle:
+                    pipe.multi()
+                    pipe.delete(key)
+                    await pipe.execute()
+        except Exception as e:
+            logging.error(f"Session lock release failed: {e}")
+    
+    @contextlib.asynccontextmanager
+    async def lock(self, sid: str) -> AsyncIterator[None]:
+        handle = await self.acquire_lock(sid)
+        try:
+            yield
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.release_lock(sid, handle)
+
+# Global session store
+session_store = SessionStore(redis=redis_client)
+
 def create_initial_session(player_name: str = "You"):
     sid = str(uuid.uuid4())
-    timeline = [
-        Message(
-            speaker="Professor Dumbledore",
-            text="Welcome, young wizard. A mysterious artifact has gone missing from the castle. Your journey begins here in the Great Hall. What would you like to do?",
-            avatar_type="purple"
-        ).dict()
-    ]
-    doc = {
-        "session_id": sid,
-        "player_name": player_name,
-        "location": "great hall",
-        "clues_found": 0,
-        "timeline": timeline,
-        "evidence": [],
-        "evidence_against": {"draco": 0, "evelyn": 0},
-        "npcs": {k: v for k, v in NPCS.items()},
-        "locations": {k: v for k, v in LOCATIONS.items()},
-    }
-    SESSIONS[sid] = doc
+    doc = Session(sid, player_name)
+    add_message(
+        doc,
+        "Professor Dumbledore",
+        "Welcome, young wizard. A mysterious artifact has gone missing from the castle. Your journey begins here in the Great Hall. What would you like to do?",
+        "purple"
+    )
     return sid, doc
 
-def get_current_state(session: Dict) -> State:
-    return State(
-        location=session["locations"][session["location"]]["display"],
-        clues_found=session["clues_found"],
-        timeline=session["timeline"],
-        evidence=session["evidence"],
-        npcs=session["npcs"],
-    )
+def get_current_state(session: Session) -> Dict:
+    """Snapshot of a session with the shape of State, built as a plain dict."""
+    return {
+        "location": LOCATIONS[session.location]["display"],
+        "clues_found": session.clues_found,
+        "timeline": list(session.timeline),
+        "evidence": list(session.evidence),
+        # Read-only template shared by every session, not copied
+        "npcs": NPCS,
+    }
+
+def add_message(session: Session, speaker: str, text: str, avatar_type: str, history: bool = True):
+    # Inputs are built internally, so skip model validation on every append
+    add_message_dict(session, {"speaker": speaker, "text": text, "avatar_type": avatar_type}, history)
+
+def add_message_dict(session: Session, message: Dict, history: bool = True):
+    """
+    Append a prebuilt message; it may be a shared constant, so never mutate it.
+    With history=False it stays out of the dialogue context given to NPCs.
+    """
+    session.timeline.append(message)
+    
+    # Narrator notices (travel, command help) aren't dialogue context for NPCs
+    if history and message["speaker"] != "Narrator":
+        remember_turn(session, message["speaker"], message["text"])
 
-def add_message(session: Dict, speaker: str, text: str, avatar_type: str):
-    session["timeline"].append(Message(speaker=speaker, text=text, avatar_type=avatar_type).dict())
+def remember_turn(session: Session, speaker: str, text: str):
+    """Add one line to the recent conversation injected into NPC prompts."""
+    recent_turns = session.recent_turns
+    recent_turns.append(f"{speaker}: {text[:HISTORY_TURN_CHARS]}")
+    while len(recent_turns) > 1 and sum(map(len, recent_turns)) > MAX_HISTORY_CHARS:
+        recent_turns.popleft()
 
 # --- Evidence Tracking ---
-def count_evidence_against(suspect: str, evidence_list: List[str]) -> int:
+def count_evidence_against(suspect: str, evidence: Set[str]) -> int:
     """Count how many pieces of evidence point to a suspect."""
-    count = 0
-    for location_clues in MYSTERY_TRUTH["clues"].values():
-        for clue_data in location_clues.values():
-            if suspect in clue_data.get("points_to", []):
-                if clue_data["description"] in evidence_list:
-                    count += 1
-    return count
+    return len(SUSPECT_TO_CLUE_DESCS.get(suspect, frozenset()) & evidence)
+
+def add_evidence(session: Session, description: str) -> bool:
+    """Record a piece of evidence; returns False if it was already known."""
+    if description in session.evidence_set:
+        return False
+    session.evidence_set.add(description)
+    session.evidence.append(description)
+    return True
+
+def add_evidence_items(session: Session, items: List[str]) -> int:
+    """Record several pieces of evidence at once; returns how many were new."""
+    evidence_set = session.evidence_set
+    new_items = [item for item in dict.fromkeys(items) if item not in evidence_set]
+    evidence_set.update(new_items)
+    session.evidence.extend(new_items)
+    return len(new_items)
 
 # --- Strategic Prompt Builder ---
-def build_strategic_prompt(session: Dict, npc_key: str, player_text: str) -> str:
-    """Builds context-aware prompt with knowledge boundaries."""
-    
-    npc_data = NPCS[npc_key]
-    npc_knowledge = MYSTERY_TRUTH["npc_knowledge"][npc_key]
-    player_evidence = session["evidence"]
-    
-    evidence_against = count_evidence_against(npc_key, player_evidence)
-    session["evidence_against"][npc_key] = evidence_against
-    
-    knowledge_section = build_knowledge_constraints(npc_key, npc_knowledge)
-    revelation_section = build_revelation_logic(npc_key, evidence_against, npc_knowledge)
-    
-    evidence_text = "\n- ".join(player_evidence) if player_evidence else "None"
-    
-    history = "\n".join([
-        f"{msg['speaker']}: {msg['text']}" 
-        for msg in session["timeline"][-5:]
-    ])
-    
-    prompt = f"""--- YOUR CHARACTER IDENTITY ---
-You are: {npc_data['display']}
-Personality: {npc_data['persona']}
+STRATEGIC_PROMPT_TEMPLATE = """--- YOUR CHARACTER IDENTITY ---
+You are: {display}
+Personality: {persona}
 
 --- YOUR KNOWLEDGE CONSTRAINTS ---
 {knowledge_section}
@@ -473,7 +835,7 @@ Personality: {npc_data['persona']}
 {revelation_section}
 
 --- CURRENT GAME STATE ---
-Player Location: {session['locations'][session['location']]['display']}
+Player Location: {location}
 Evidence Player Has: 
 - {evidence_text}
 
@@ -485,15 +847,36 @@ Evidence Pointing to You: {evidence_against} pieces
 --- PLAYER'S QUESTION ---
 {player_text}
 
---- RESPOND AS {npc_data['display']} ---
+--- RESPOND AS {display} ---
 Consider your personality, knowledge, and the pressure from evidence.
 Output valid JSON only."""
+
+def build_strategic_prompt(session: Session, npc_key: str, player_text: str) -> str:
+    """Builds context-aware prompt with knowledge boundaries."""
+    
+    npc_data = NPCS[npc_key]
+    player_evidence = session.evidence
     
-    return prompt
+    evidence_against = count_evidence_against(npc_key, session.evidence_set)
+    session.evidence_against[npc_key] = evidence_against
+    
+    return STRATEGIC_PROMPT_TEMPLATE.format_map({
+        "display": npc_data["display"],
+        "persona": npc_data["persona"],
+        "knowledge_section": build_knowledge_constraints(npc_key),
+        "revelation_section": build_revelation_logic(npc_key, evidence_against),
+        "location": LOCATIONS[session.location]["display"],
+        "evidence_text": "\n- ".join(player_evidence) if player_evidence else "None",
+        "evidence_against": evidence_against,
+        "history": "\n".join(session.recent_turns),
+        "player_text": player_text,
+    })
 
-def build_knowledge_constraints(npc_key: str, npc_knowledge: Dict) -> str:
+@functools.lru_cache(maxsize=64)
+def build_knowledge_constraints(npc_key: str) -> str:
     """Define what NPC knows and doesn't know."""
     
+    npc_knowledge = MYSTERY_TRUTH["npc_knowledge"][npc_key]
     knows = npc_knowledge.get("knows", [])
     
     if "ALL" in knows:
@@ -512,10 +895,12 @@ def build_knowledge_constraints(npc_key: str, npc_knowledge: Dict) -> str:
 - You can reveal these clues if asked: {', '.join(will_reveal)}
 - You DON'T know who the culprit is (don't guess)"""
 
-def build_revelation_logic(npc_key: str, evidence_count: int, npc_knowledge: Dict) -> str:
+@functools.lru_cache(maxsize=64)
+def build_revelation_logic(npc_key: str, evidence_count: int) -> str:
     """Define when NPC should reveal information."""
     
     if npc_key == "draco":
+        npc_knowledge = MYSTERY_TRUTH["npc_knowledge"][npc_key]
         threshold = npc_knowledge.get("confess_threshold", 3)
         
         if evidence_count >= threshold:
@@ -524,7 +909,7 @@ def build_revelation_logic(npc_key: str, evidence_count: int, npc_knowledge: Dic
 - Admit guilt: "Fine! I took it! My family pressured me!"
 - Reveal location: "It's hidden in the courtyard fountain!"
 - Be remorseful"""
-        elif evidence_count >= 2:
+        elif evidence_count >= NERVOUS_THRESHOLD:
             return f"""⚠️ WARNING: Player has {evidence_count} evidence pieces.
 - Show NERVOUSNESS
 - Admit small details but deny theft
@@ -550,30 +935,164 @@ def build_revelation_logic(npc_key: str, evidence_count: int, npc_knowledge: Dic
 - Never directly accuse anyone"""
 
 # --- LLM Call with Caching ---
-def call_gemini_llm(user_prompt: str) -> str:
-    if llm_model is None:
+def _gemini_request_body(user_prompt: str) -> bytes:
+    return orjson.dumps({
+        "systemInstruction": SYSTEM_INSTRUCTION,
+        "contents": [{"role": "user", "parts": [{"text": user_prompt}]}],
+        "generationConfig": GENERATION_CONFIG,
+    })
+
+def _candidate_text(data: Dict) -> Optional[str]:
+    """Text of the first candidate in a generateContent response, if any."""
+    candidates = data.get("candidates")
+    if not candidates:
+        return None
+    parts = candidates[0].get("content", {}).get("parts")
+    if not parts:
+        return None
+    return parts[0].get("text")
+
+async def call_gemini_llm(user_prompt: str) -> str:
+    if not GEMINI_API_KEY:
         raise RuntimeError("LLM model not configured. Set GEMINI_API_KEY.")
     
     try:
         logging.info("Calling Gemini API...")
-        generation_config = genai.GenerationConfig(
-            response_mime_type="application/json"
-        )
-        response = llm_model.generate_content(user_prompt, generation_config=generation_config)
+        response = await http_client.post(f"/models/{MODEL}:generateContent", content=_gemini_request_body(user_prompt))
+        response.raise_for_status()
         
-        if response.candidates and response.candidates[0].content.parts:
-            api_response_text = response.candidates[0].content.parts[0].text
-            logging.info("Gemini API success.")
-            return api_response_text
-        else:
+        api_response_text = _candidate_text(orjson.loads(response.content))
+        if api_response_text is None:
             raise Exception("Gemini returned no content.")
+        logging.info("Gemini API success.")
+        return api_response_text
     except Exception as e:
         logging.error(f"Gemini API failed: {e}")
         raise
 
+async def stream_gemini_llm(user_prompt: str) -> AsyncIterator[str]:
+    """Same as call_gemini_llm, but yields the raw JSON text as it arrives."""
+    if not GEMINI_API_KEY:
+        raise RuntimeError("LLM model not configured. Set GEMINI_API_KEY.")
+    
+    try:
+        logging.info("Streaming from Gemini API...")
+        async with http_client.stream(
+            "POST",
+            f"/models/{MODEL}:streamGenerateContent",
+            params={"alt": "sse"},
+            content=_gemini_request_body(user_prompt),
+        ) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                text = _candidate_text(orjson.loads(line[6:]))
+                if text:
+                    yield text
+        logging.info("Gemini API stream complete.")
+    except Exception as e:
+        logging.error(f"Gemini API stream failed: {e}")
+        raise
+
+class LLMCoalescer:
+    """
+    Single-flight for LLM calls: requests with a prompt that is already in
+    flight await that call instead of sending their own. Every other prompt
+    is sent immediately.
+    """
+    
+    def __init__(self):
+        self.in_flight: Dict[str, asyncio.Future] = {}
+    
+    async def submit(self, prompt: str) -> str:
+        future = self.in_flight.get(prompt)
+        if future is None:
+            future = asyncio.ensure_future(call_gemini_llm(prompt))
+            self.in_flight[prompt] = future
+            future.add_done_callback(lambda done: self._forget(prompt, done))
+        else:
+            logging.info("Sharing an in-flight LLM call for an identical prompt")
+        # Shielded: one caller giving up must not cancel the call for the others
+        return await asyncio.shield(future)
+    
+    def _forget(self, prompt: str, future: asyncio.Future):
+        if self.in_flight.get(prompt) is future:
+            del self.in_flight[prompt]
+    
+    async def close(self):
+        for future in list(self.in_flight.values()):
+            future.cancel()
+        self.in_flight.clear()
+
+# Global coalescer for non-streaming NPC replies
+llm_coalescer = LLMCoalescer()
+
+class ReplyStreamExtractor:
+    """
+    Incrementally pulls the "npc_reply" string out of streamed JSON.
+    Only the reply is needed early; the other fields are parsed once complete.
+    """
+    
+    KEY_RE = re.compile(r'"npc_reply"\s*:\s*"')
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+    
+    def __init__(self):
+        self.buffer = ""
+        self.pos: Optional[int] = None  # Index of the next undecoded reply char
+        self.done = False
+    
+    def feed(self, chunk: str) -> str:
+        """Add raw text, returning whatever new reply text it completes."""
+        self.buffer += chunk
+        if self.done:
+            return ""
+        if self.pos is None:
+            match = self.KEY_RE.search(self.buffer)
+            if match is None:
+                return ""
+            self.pos = match.end()
+        
+        decoded = []
+        buffer, pos = self.buffer, self.pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.done = True
+                pos += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                pos += 1
+                continue
+            # Escape sequence: wait for the rest of it if it's split across chunks
+            if pos + 1 >= len(buffer):
+                break
+            code = buffer[pos + 1]
+            if code != "u":
+                decoded.append(self.ESCAPES.get(code, code))
+                pos += 2
+                continue
+            if pos + 6 > len(buffer):
+                break
+            codepoint = int(buffer[pos + 2:pos + 6], 16)
+            if 0xD800 <= codepoint < 0xDC00:
+                # Surrogate pair (e.g. emoji): decode both halves together
+                if pos + 12 > len(buffer):
+                    break
+                decoded.append(orjson.loads(f'"{buffer[pos:pos + 12]}"'))
+                pos += 12
+            else:
+                decoded.append(chr(codepoint))
+                pos += 6
+        self.pos = pos
+        return "".join(decoded)
+
 def parse_llm_response(raw_text: str) -> Tuple[str, List[str], str]:
     try:
-        data = json.loads(raw_text)
+        data = orjson.loads(raw_text)
         reply = data.get("npc_reply", "I can't answer that right now.")
         mentions = data.get("mentions", [])
         tone = data.get("tone", "neutral")
@@ -582,17 +1101,96 @@ def parse_llm_response(raw_text: str) -> Tuple[str, List[str], str]:
         logging.info(f"NPC thinking: {thinking}")
         
         return reply, mentions, tone
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         logging.error(f"Failed to parse JSON: {e}")
         logging.error(f"Raw: {raw_text}")
         raise ValueError(f"Invalid JSON from LLM: {e}")
 
-# --- Validation Layer ---
-def validate_npc_response(npc_key: str, reply: str, evidence_count: int) -> Dict:
+async def generate_npc_response(session: Session, npc_key: str, player_text: str, evidence_count: int,
+                                on_token: Optional[Callable[[str], None]] = None) -> Dict:
     """
-    Validate response and return metrics for evaluation.
-    Returns dict with validation results and quality scores.
+    Generate a fresh NPC reply through the LLM and cache it.
+    With on_token, the reply is streamed and passed to it piece by piece.
     """
+    prompt = build_strategic_prompt(session, npc_key, player_text)
+    if on_token is None:
+        raw_response = await llm_coalescer.submit(prompt)
+    else:
+        extractor = ReplyStreamExtractor()
+        chunks = []
+        async for chunk in stream_gemini_llm(prompt):
+            chunks.append(chunk)
+            text = extractor.feed(chunk)
+            if text:
+                on_token(text)
+        raw_response = "".join(chunks)
+    reply, mentions, tone = parse_llm_response(raw_response)
+    
+    response_data = {
+        "npc_reply": reply,
+        "mentions": mentions,
+        "tone": tone
+    }
+    await response_cache.set(npc_key, player_text, evidence_count, response_data)
+    return response_data
+
+def _with_player_turn(session: Session, player_text: str) -> Session:
+    """A copy of session whose history already holds player_text, as in a live turn."""
+    preview = copy.copy(session)
+    preview.recent_turns = deque(session.recent_turns, maxlen=HISTORY_TURNS)
+    # build_strategic_prompt writes evidence_against, so it must not be shared
+    preview.evidence_against = dict(session.evidence_against)
+    remember_turn(preview, session.player_name, player_text)
+    return preview
+
+async def warm_cache(session: Session, texts: List[str], max_concurrency: int = 8) -> Dict:
+    """
+    Pre-generate cached replies for player dialogue texts concurrently.
+    Each reply is generated from the prompt a live turn with that text would
+    build, and the session itself is left untouched.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def warm_one(npc_key: str, player_text: str, evidence_count: int):
+        async with semaphore:
+            await generate_npc_response(_with_player_turn(session, player_text), npc_key, player_text, evidence_count)
+    
+    jobs = []
+    skipped = 0
+    for player_text in dict.fromkeys(texts):
+        npc_key, _ = find_npc_in_text(player_text)
+        evidence_count = session.evidence_against.get(npc_key, 0)
+        if await response_cache.contains(npc_key, player_text, evidence_count):
+            skipped += 1
+            continue
+        jobs.append(warm_one(npc_key, player_text, evidence_count))
+    
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    for error in failed:
+        logging.error(f"Cache warm failed: {error}")
+    
+    return {
+        "warmed": len(results) - len(failed),
+        "already_cached": skipped,
+        "failed": len(failed)
+    }
+
+# --- Validation Layer ---
+LOCATION_KEYWORDS = frozenset(["room", "chamber", "dungeon", "tower", "passage"])
+VALID_LOCATION_NAMES = frozenset(loc["display"].lower() for loc in LOCATIONS.values())
+REVELATION_MARKERS = frozenset(["fountain", "compass", "courtyard", "hidden"])
+CULPRIT_MARKERS = frozenset(["draco", "took", "guilty", "thief"])
+
+# One pass over the reply finds every marker; the lookahead lets overlapping
+# markers ("the courtyard" / "courtyard") all match, like plain substring checks.
+VALIDATOR_RE = re.compile("(?=({}))".format("|".join(
+    re.escape(marker)
+    for marker in sorted(LOCATION_KEYWORDS | VALID_LOCATION_NAMES | REVELATION_MARKERS | CULPRIT_MARKERS, key=len, reverse=True)
+)))
+
+def _validate_common(reply: str) -> Tuple[Dict, set]:
+    """Checks every NPC shares; returns the validation dict and markers found."""
     
     validation = {
         "knowledge_violation": False,
@@ -603,152 +1201,203 @@ def validate_npc_response(npc_key: str, reply: str, evidence_count: int) -> Dict
         "relevance_score": 5,   # Default high score
     }
     
-    reply_lower = reply.lower()
+    found = set(VALIDATOR_RE.findall(reply.lower()))
     
-    # Check for hallucinated locations
-    valid_location_names = [loc["display"].lower() for loc in LOCATIONS.values()]
-    location_keywords = ["room", "chamber", "dungeon", "tower", "passage"]
+    # Check for hallucinated locations (a location word that isn't one of ours)
+    if not found.isdisjoint(LOCATION_KEYWORDS) and found.isdisjoint(VALID_LOCATION_NAMES):
+        validation["hallucinated_location"] = True
+        validation["coherence_score"] = 2  # Penalize
+        logging.warning(f"Possible hallucinated location in: {reply}")
     
-    for keyword in location_keywords:
-        if keyword in reply_lower:
-            # Check if it's not one of our valid locations
-            is_valid = any(loc_name in reply_lower for loc_name in valid_location_names)
-            if not is_valid:
-                validation["hallucinated_location"] = True
-                validation["coherence_score"] = 2  # Penalize
-                logging.warning(f"Possible hallucinated location in: {reply}")
+    # Hallucinated NPCs would need NER; no cheap heuristic is applied here
     
-    # Check for hallucinated NPCs
-    valid_npc_names = [npc["display"].lower() for npc in NPCS.values()]
-    # Simple check: if mentions a person-like name not in our NPC list
-    if "professor" in reply_lower or "student" in reply_lower:
-        mentioned_valid = any(npc_name in reply_lower for npc_name in valid_npc_names)
-        # This is a simple heuristic - in production would use NER
+    return validation, found
+
+def validate_draco(reply: str, evidence_count: int) -> Dict:
+    validation, found = _validate_common(reply)
     
     # Check for premature revelation (compass location revealed too early)
-    if npc_key == "draco":
-        reveals_compass_location = ("fountain" in reply_lower and "compass" in reply_lower) or \
-                                  ("courtyard" in reply_lower and "hidden" in reply_lower)
-        
-        if reveals_compass_location and evidence_count < 3:
-            validation["premature_revelation"] = True
-            validation["relevance_score"] = 2  # Penalize
-            logging.warning(f"Premature revelation at evidence_count={evidence_count}")
+    reveals_compass_location = {"fountain", "compass"} <= found or {"courtyard", "hidden"} <= found
     
-    # Check knowledge boundaries
-    npc_knowledge = MYSTERY_TRUTH["npc_knowledge"][npc_key]
-    knows = npc_knowledge.get("knows", [])
+    if reveals_compass_location and evidence_count < 3:
+        validation["premature_revelation"] = True
+        validation["relevance_score"] = 2  # Penalize
+        logging.warning(f"Premature revelation at evidence_count={evidence_count}")
     
-    if "ALL" not in knows:
-        # NPC shouldn't reveal culprit if they don't know
-        if "draco" in reply_lower and "took" in reply_lower and npc_key != "draco":
-            # Check if this NPC should know Draco is guilty
-            if npc_key == "evelyn":
-                # Evelyn only suspects, doesn't know for sure
-                if "guilty" in reply_lower or "thief" in reply_lower:
-                    validation["knowledge_violation"] = True
-                    validation["coherence_score"] = 2
+    return validation
+
+def validate_evelyn(reply: str, evidence_count: int) -> Dict:
+    validation, found = _validate_common(reply)
     
+    # Check knowledge boundaries: Evelyn only suspects Draco, doesn't know for sure
+    if {"draco", "took"} <= found and ("guilty" in found or "thief" in found):
+        validation["knowledge_violation"] = True
+        validation["coherence_score"] = 2
+    
+    return validation
+
+def validate_dumbledore(reply: str, evidence_count: int) -> Dict:
+    validation, _ = _validate_common(reply)
     return validation
 
+# Each NPC only runs the checks it can actually fail
+VALIDATORS = {
+    "draco": validate_draco,
+    "evelyn": validate_evelyn,
+    "professor dumbledore": validate_dumbledore,
+}
+
+# Cached replies come back verbatim, so the same triple is validated again
+# and again; results are shared between callers and must not be mutated
+@functools.lru_cache(maxsize=2048)
+def validate_npc_response(npc_key: str, reply: str, evidence_count: int) -> Dict:
+    """
+    Validate response and return metrics for evaluation.
+    Returns dict with validation results and quality scores.
+    """
+    return VALIDATORS[npc_key](reply, evidence_count)
+
 # --- Deterministic Actions ---
-def handle_deterministic_action(session: Dict, player_action: str) -> Optional[Message]:
-    action = player_action.lower().strip()
-    
-    # GO TO [LOCATION]
-    if action.startswith("go to "):
-        target_loc = action[6:].strip()
-        for key, loc in LOCATIONS.items():
-            if key in target_loc:
-                if session["location"] == key:
-                    return Message(speaker="Narrator", text=f"You are already in {loc['display']}.", avatar_type="brown")
-                
-                session["location"] = key
-                add_message(session, "Narrator", f"You travel to **{loc['display']}**.", "brown")
-                return Message(speaker="Narrator", text=loc["description"], avatar_type="brown")
-        
-        return Message(speaker="Narrator", text=f"Can't find '{target_loc}'. Try: great hall, library, courtyard, dumbledore's office", avatar_type="brown")
+def narrator_message(text: str) -> Dict:
+    return {**NARRATOR_TEMPLATE, "text": text}
+
+# Fixed fallback replies, built once and shared by every session's timeline
+NPC_NOT_FOUND_MSG = narrator_message("I don't see that person here. Try talking to: Professor Dumbledore, Draco, or Evelyn.")
+UNKNOWN_CMD_MSG = narrator_message("I don't understand that command. Try: 'go to [location]', 'inspect [object]', or 'talk to [NPC]'.")
+
+def _find_location(target_loc: str) -> Optional[str]:
+    """Resolve a typed destination to a LOCATIONS key."""
+    key = LOCATION_ALIASES.get(target_loc)
+    if key is not None:
+        return key
+    # Fall back to a lenient scan for phrasing like "go to the library now"
+    for key in LOCATIONS:
+        if key in target_loc:
+            return key
+    return None
+
+def _find_clue(current_loc: str, item: str) -> Optional[Dict]:
+    """Resolve an inspected item to a clue in the current location."""
+    location_clues = CLUE_ALIASES.get(current_loc)
+    if not location_clues:
+        return None
+    item = item.replace("_", " ")
+    clue_data = location_clues.get(item)
+    if clue_data is not None:
+        return clue_data
+    for clue_name, clue_data in location_clues.items():
+        if clue_name in item or item in clue_name:
+            return clue_data
+    return None
+
+def handle_go(session: Session, target_loc: str) -> Dict:
+    key = _find_location(target_loc)
+    if key is None:
+        return narrator_message(f"Can't find '{target_loc}'. Try: great hall, library, courtyard, dumbledore's office")
     
-    # INSPECT [OBJECT]
-    if action.startswith("inspect ") or action.startswith("examine "):
-        item = action.split(maxsplit=1)[1].strip()
-        current_loc = session["location"]
-        
-        if current_loc in MYSTERY_TRUTH["clues"]:
-            location_clues = MYSTERY_TRUTH["clues"][current_loc]
-            
-            for clue_id, clue_data in location_clues.items():
-                if clue_id in item or item in clue_id:
-                    if clue_data["description"] not in session["evidence"]:
-                        session["evidence"].append(clue_data["description"])
-                        session["clues_found"] += 1
-                        
-                        for suspect in clue_data.get("points_to", []):
-                            session["evidence_against"][suspect] += 1
-                        
-                        if clue_data.get("solves_case"):
-                            msg = f"🎉 **CASE SOLVED!** You found {clue_data['description']}! {clue_data['reveals']}"
-                            return Message(speaker="Narrator", text=msg, avatar_type="brown")
-                        
-                        msg = f"📝 **New Evidence:** {clue_data['description']}. {clue_data['reveals']}"
-                        return Message(speaker="Narrator", text=msg, avatar_type="brown")
-                    else:
-                        return Message(speaker="Narrator", text="You've already examined this thoroughly.", avatar_type="brown")
-        
-        return Message(speaker="Narrator", text=f"You inspect the **{item}** but find nothing unusual.", avatar_type="brown")
+    loc = LOCATIONS[key]
+    if session.location == key:
+        return narrator_message(f"You are already in {loc['display']}.")
     
-    return None
+    session.location = key
+    add_message(session, "Narrator", f"You travel to **{loc['display']}**.", "brown")
+    return narrator_message(loc["description"])
+
+def handle_inspect(session: Session, item: str) -> Dict:
+    clue_data = _find_clue(session.location, item)
+    if clue_data is None:
+        return narrator_message(f"You inspect the **{item}** but find nothing unusual.")
+    
+    if not add_evidence(session, clue_data["description"]):
+        return narrator_message("You've already examined this thoroughly.")
+    
+    session.clues_found += 1
+    
+    for suspect in clue_data.get("points_to", []):
+        session.evidence_against[suspect] += 1
+    
+    if clue_data.get("solves_case"):
+        msg = f"🎉 **CASE SOLVED!** You found {clue_data['description']}! {clue_data['reveals']}"
+        return narrator_message(msg)
+    
+    msg = f"📝 **New Evidence:** {clue_data['description']}. {clue_data['reveals']}"
+    return narrator_message(msg)
+
+DETERMINISTIC_VERBS = {
+    "go to": handle_go,
+    "inspect": handle_inspect,
+    "examine": handle_inspect,
+}
+# "<verb> <target>", compiled once; group 1 is a DETERMINISTIC_VERBS key
+DETERMINISTIC_RE = re.compile(rf"({'|'.join(map(re.escape, DETERMINISTIC_VERBS))}) (.*)", re.DOTALL)
+
+def handle_deterministic_action(session: Session, player_action: str) -> Optional[Dict]:
+    # GO TO [LOCATION] / INSPECT|EXAMINE [OBJECT]
+    match = DETERMINISTIC_RE.match(player_action.lower().strip())
+    if match is None:
+        return None
+    verb, target = match.groups()
+    return DETERMINISTIC_VERBS[verb](session, target.strip())
 
 # --- Dialogue Detection ---
 DIALOGUE_TRIGGERS = ["talk to ", "speak with ", "speak to ", "ask "]
+DIALOGUE_RE = re.compile("|".join(map(re.escape, DIALOGUE_TRIGGERS)), re.IGNORECASE)
 
 def find_npc_in_text(player_text: str) -> Optional[Tuple[str, str]]:
-    text_lower = player_text.lower()
-    
-    for npc_key, npc_data in NPCS.items():
-        aliases = npc_data.get("aliases", [npc_key])
-        for alias in aliases:
-            if alias in text_lower:
-                return (npc_key, npc_data["display"])
-    
-    return None
+    match = ALIAS_RE.search(player_text)
+    if match is None:
+        return None
+    return ALIAS_TO_NPC[match.group(0).lower()]
 
 def is_dialogue_command(player_text: str) -> bool:
-    text_lower = player_text.lower()
-    return any(trigger in text_lower for trigger in DIALOGUE_TRIGGERS)
+    return DIALOGUE_RE.match(player_text) is not None
 
 # --- API Endpoints ---
-@app.post("/session/start")
-def start_game_session():
+@app.post("/session/start", responses={200: {"model": StartResponse}})
+async def start_game_session():
     sid, doc = create_initial_session()
-    return {"session_id": sid, "state": get_current_state(doc).dict()}
+    await session_store.save_session(doc)
+    return {"session_id": sid, "state": get_current_state(doc)}
 
-@app.post("/session/action")
-def process_player_action(action: Action):
-    sid = action.session_id
-    if sid not in SESSIONS:
-        raise HTTPException(status_code=404, detail="Session not found.")
-    
-    session = SESSIONS[sid]
-    player_text = action.text.strip()
-    player_name = session.get("player_name", "You")
+@app.post("/session/action", responses={200: {"model": ActionResponse}})
+async def process_player_action(action: Action):
+    async with session_store.lock(action.session_id):
+        session = await session_store.get_session(action.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found.")
+        
+        result = await run_player_action(session, action.text.strip())
+        await session_store.save_session(session)
+    return result
+
+async def run_player_action(session: Session, player_text: str,
+                            on_token: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+    """
+    Apply one player action to a session and build the API response.
+    on_token receives NPC reply text as it streams in from the LLM, along with
+    the replying NPC's speaker/avatar_type template.
+    """
+    player_name = session.player_name
     
-    add_message(session, player_name, player_text, "blue")
+    # Commands aren't conversation; only lines spoken to an NPC join the history
+    add_message(session, player_name, player_text, "blue", history=False)
     
     # Handle deterministic actions first
     deterministic_reply = handle_deterministic_action(session, player_text)
     if deterministic_reply:
-        return {"reply": [deterministic_reply.dict()], "state": get_current_state(session).dict()}
+        return {"reply": [deterministic_reply], "state": get_current_state(session)}
     
     # Handle NPC dialogue with caching
     if is_dialogue_command(player_text):
         npc_result = find_npc_in_text(player_text)
         if npc_result:
             npc_key, npc_name = npc_result
+            avatar = NPCS[npc_key]["avatar"]
+            remember_turn(session, player_name, player_text)
             
             # Check cache first
-            evidence_count = session["evidence_against"].get(npc_key, 0)
-            cached_response = response_cache.get(npc_key, player_text, evidence_count)
+            evidence_count = session.evidence_against.get(npc_key, 0)
+            cached_response = await response_cache.get(npc_key, player_text, evidence_count)
             
             if cached_response:
                 # Use cached response
@@ -758,17 +1407,11 @@ def process_player_action(action: Action):
             else:
                 # Generate new response
                 try:
-                    prompt = build_strategic_prompt(session, npc_key, player_text)
-                    raw_response = call_gemini_llm(prompt)
-                    reply, mentions, tone = parse_llm_response(raw_response)
-                    
-                    # Cache the response
-                    response_data = {
-                        "npc_reply": reply,
-                        "mentions": mentions,
-                        "tone": tone
-                    }
-                    response_cache.set(npc_key, player_text, evidence_count, response_data)
+                    emit = functools.partial(on_token, speaker=NPC_MSG_TEMPLATE[npc_key]) if on_token else None
+                    response_data = await generate_npc_response(session, npc_key, player_text, evidence_count, emit)
+                    reply = response_data["npc_reply"]
+                    mentions = response_data["mentions"]
+                    tone = response_data["tone"]
                     
                 except Exception as e:
                     logging.error(f"LLM error: {e}")
@@ -788,59 +1431,138 @@ def process_player_action(action: Action):
             )
             
             # Add NPC response to timeline
-            add_message(session, npc_name, reply, NPCS[npc_key]["avatar"])
+            add_message(session, npc_name, reply, avatar)
             
             # Add newly revealed clues to evidence
-            for mention in mentions:
-                if mention not in session["evidence"]:
-                    session["evidence"].append(mention)
-                    session["clues_found"] += 1
+            session.clues_found += add_evidence_items(session, mentions)
             
-            npc_message = Message(
-                speaker=npc_name,
-                text=reply,
-                avatar_type=NPCS[npc_key]["avatar"]
-            )
+            npc_message = {**NPC_MSG_TEMPLATE[npc_key], "text": reply}
             
             return {
-                "reply": [npc_message.dict()],
-                "state": get_current_state(session).dict()
+                "reply": [npc_message],
+                "state": get_current_state(session)
             }
         
         # NPC not found in dialogue attempt
-        feedback = "I don't see that person here. Try talking to: Professor Dumbledore, Draco, or Evelyn."
-        add_message(session, "Narrator", feedback, "brown")
+        add_message_dict(session, NPC_NOT_FOUND_MSG)
         return {
-            "reply": [Message(speaker="Narrator", text=feedback, avatar_type="brown").dict()],
-            "state": get_current_state(session).dict()
+            "reply": [NPC_NOT_FOUND_MSG],
+            "state": get_current_state(session)
         }
     
     # Default fallback for unrecognized commands
-    feedback = "I don't understand that command. Try: 'go to [location]', 'inspect [object]', or 'talk to [NPC]'."
-    add_message(session, "Narrator", feedback, "brown")
+    add_message_dict(session, UNKNOWN_CMD_MSG)
     return {
-        "reply": [Message(speaker="Narrator", text=feedback, avatar_type="brown").dict()],
-        "state": get_current_state(session).dict()
+        "reply": [UNKNOWN_CMD_MSG],
+        "state": get_current_state(session)
     }
 
+@app.post("/session/action/batch", responses={200: {"model": List[Union[ActionResponse, BatchItemError]]}})
+async def process_player_actions(actions: List[Action]):
+    """
+    Send several player actions at once; identical LLM prompts across them share one call.
+    Actions for one session run in order, different sessions run concurrently.
+    Returns one /session/action-shaped result per action, in request order.
+    """
+    by_session: Dict[str, List[int]] = {}
+    for index, action in enumerate(actions):
+        by_session.setdefault(action.session_id, []).append(index)
+    
+    results: List[Optional[Dict]] = [None] * len(actions)
+    
+    async def run_session(sid: str, indices: List[int]):
+        try:
+            async with session_store.lock(sid):
+                session = await session_store.get_session(sid)
+                if session is None:
+                    raise HTTPException(status_code=404, detail="Session not found.")
+                for index in indices:
+                    results[index] = await run_player_action(session, actions[index].text.strip())
+                await session_store.save_session(session)
+        except HTTPException as e:
+            for index in indices:
+                results[index] = {"session_id": sid, "detail": e.detail}
+    
+    await asyncio.gather(*(run_session(sid, indices) for sid, indices in by_session.items()))
+    return results
+
+def _sse_event(payload: Dict) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+async def stream_action_events(sid: str, player_text: str) -> AsyncIterator[bytes]:
+    """
+    Run an action, emitting {"token": ...} events while the NPC reply streams
+    (the first one also carries "speaker" and "avatar_type"), then one {"done": true, "reply": ..., "state": ...} event with the same
+    shape as /session/action. The final event is authoritative; an
+    {"error": ...} event is sent instead if the action can't run.
+    """
+    # Locked inside the generator, so a response that never starts holds no lock
+    try:
+        handle = await session_store.acquire_lock(sid)
+    except HTTPException as e:
+        yield _sse_event({"error": e.detail})
+        return
+    try:
+        session = await session_store.get_session(sid)
+        if session is None:
+            yield _sse_event({"error": "Session not found."})
+            return
+        
+        tokens: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(run_player_action(
+            session, player_text, on_token=lambda token, speaker: tokens.put_nowait((token, speaker))
+        ))
+        task.add_done_callback(lambda _: tokens.put_nowait(None))
+        try:
+            named = False
+            while (item := await tokens.get()) is not None:
+                token, speaker = item
+                if named:
+                    yield _sse_event({"token": token})
+                else:
+                    yield _sse_event({**speaker, "token": token})
+                    named = True
+            result = await task
+            yield _sse_event({"done": True, **result})
+        finally:
+            if not task.done():
+                task.cancel()
+            # On client disconnect Starlette cancels the scope this generator
+            # runs in; shield the cleanup so the save and release still finish
+            with anyio.CancelScope(shield=True):
+                await session_store.save_session(session)
+    finally:
+        with anyio.CancelScope(shield=True):
+            await session_store.release_lock(sid, handle)
+
+@app.post("/session/action/stream")
+async def stream_player_action(action: Action):
+    """Send player action; the NPC reply streams back as server-sent events."""
+    if await session_store.get_session(action.session_id) is None:
+        raise HTTPException(status_code=404, detail="Session not found.")
+    
+    return StreamingResponse(stream_action_events(action.session_id, action.text.strip()), media_type="text/event-stream")
+
 @app.get("/")
-def read_root():
+async def read_root():
     """Health check and API info."""
     return {
         "message": "Hogwarts Mystery Game Backend with Evaluation Framework",
         "status": "running",
-        "llm_configured": llm_model is not None,
+        "llm_configured": bool(GEMINI_API_KEY),
         "version": "v2.0-evaluation-framework",
         "endpoints": {
             "POST /session/start": "Start new game session",
             "POST /session/action": "Send player action",
+            "POST /session/action/stream": "Send player action, streaming the reply as server-sent events",
+            "POST /session/action/batch": "Send several player actions in one request",
             "GET /evaluation/report": "Get evaluation metrics report",
             "POST /evaluation/reset": "Reset evaluation metrics"
         }
     }
 
 @app.get("/evaluation/report")
-def get_evaluation_report():
+async def get_evaluation_report():
     """
     Get comprehensive evaluation report showing Test → Measurement → Metric reconciliation.
     
@@ -852,14 +1574,12 @@ def get_evaluation_report():
     return eval_metrics.generate_report()
 
 @app.post("/evaluation/reset")
-def reset_evaluation_metrics():
+async def reset_evaluation_metrics():
     """Reset all evaluation metrics and cache for fresh testing."""
     eval_metrics.reset()
     
     # Also clear cache for clean slate
-    response_cache.cache.clear()
-    response_cache.hits = 0
-    response_cache.misses = 0
+    await response_cache.clear()
     
     return {
         "message": "Evaluation metrics and response cache have been reset",
@@ -867,21 +1587,21 @@ def reset_evaluation_metrics():
         "cache_reset": True
     }
 
-@app.get("/session/{session_id}/state")
-def get_session_state(session_id: str):
+@app.get("/session/{session_id}/state", responses={200: {"model": SessionStateResponse}})
+async def get_session_state(session_id: str):
     """Get current state of a session."""
-    if session_id not in SESSIONS:
+    session = await session_store.get_session(session_id)
+    if session is None:
         raise HTTPException(status_code=404, detail="Session not found.")
     
-    session = SESSIONS[session_id]
     return {
         "session_id": session_id,
-        "state": get_current_state(session).dict(),
-        "evidence_against": session["evidence_against"]
+        "state": get_current_state(session),
+        "evidence_against": session.evidence_against
     }
 
 @app.get("/debug/mystery-truth")
-def get_mystery_truth():
+async def get_mystery_truth():
     """
     Debug endpoint to view the ground truth (only for testing/evaluation).
     In production, this should be removed or protected.
@@ -889,12 +1609,40 @@ def get_mystery_truth():
     return MYSTERY_TRUTH
 
 @app.get("/debug/cache-stats")
-def get_cache_stats():
+async def get_cache_stats():
     """Get cache performance statistics."""
-    return response_cache.get_stats()
+    return {**response_cache.get_stats(), "cache_info": response_cache.cache_info()._asdict()}
+
+@app.post("/debug/warm-cache")
+async def warm_response_cache(request: WarmCacheRequest):
+    """Pre-generate NPC replies for a session's current evidence state."""
+    session = await session_store.get_session(request.session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found.")
+    
+    if len(request.texts) > WARM_CACHE_MAX_TEXTS:
+        raise HTTPException(status_code=400, detail=f"At most {WARM_CACHE_MAX_TEXTS} texts per request.")
+    
+    texts = [text.strip() for text in request.texts]
+    unresolved = [text for text in texts if not is_dialogue_command(text) or find_npc_in_text(text) is None]
+    if unresolved:
+        raise HTTPException(status_code=400, detail=f"Not a conversation with a known NPC: {'; '.join(unresolved)}")
+    
+    return await warm_cache(session, texts)
+
+@app.on_event("shutdown")
+async def close_connection_pools():
+    await llm_coalescer.close()
+    await http_client.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvloop/httptools when installed (not available on Windows)
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    uvicorn.run(app, host="0.0.0.0", port=port, loop=loop, http=http)
 
@@ -0,0 +1,22 @@
+"""Gunicorn settings for production: gunicorn backend.app:app -c gunicorn_conf.py"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# UvicornWorker picks uvloop and httptools automatically when they are installed
+worker_class = "uvicorn.workers.UvicornWorker"
+# Sessions and cached replies are only shared between workers through Redis;
+# without it a request could land on a worker that never saw its session
+_default_workers = (os.cpu_count() or 1) * 2 + 1 if os.getenv("REDIS_URL") else 1
+workers = int(os.getenv("WEB_CONCURRENCY", _default_workers))
+loglevel = "warning"
+# Slow LLM replies hold a request open; give them room before a worker is recycled
+timeout = 60
+graceful_timeout = 30
+
+
+def on_starting(server):
+    if server.cfg.workers > 1 and not os.getenv("REDIS_URL"):
+        server.log.warning(
+            "Running %d workers without REDIS_URL: each worker keeps its own sessions",
+            server.cfg.workers,
+        )
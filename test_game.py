@@ -2,82 +2,84 @@
 Automated Test Suite for Hogwarts Mystery Game
 Tests: Consistency, Knowledge Boundaries, Progression
 """
-import requests
-import json
-import time
+import asyncio
+from typing import Awaitable, Callable, List, Tuple
+
+import httpx
 
 BASE = "http://127.0.0.1:8000"
 
-def test_consistency():
+# One keep-alive pool shared by every test; failed requests are not retried
+POOL_LIMITS = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+
+async def test_consistency(client: httpx.AsyncClient, log=print):
     """Test 1: Response consistency via caching"""
-    print("🧪 Test 1: Consistency Test")
-    print("   Testing if NPCs give same answer to repeated questions...")
+    log("🧪 Test 1: Consistency Test")
+    log("   Testing if NPCs give same answer to repeated questions...")
     
     # Start session
-    resp = requests.post(f"{BASE}/session/start")
+    resp = await client.post("/session/start")
     sid = resp.json()["session_id"]
     
     # Go to library
-    requests.post(f"{BASE}/session/action", json={"session_id": sid, "text": "go to library"})
+    await client.post("/session/action", json={"session_id": sid, "text": "go to library"})
     
     # Ask Draco same question twice
     question = "Where were you last night?"
     
-    r1 = requests.post(f"{BASE}/session/action", json={"session_id": sid, "text": f"talk to draco: {question}"})
+    r1 = await client.post("/session/action", json={"session_id": sid, "text": f"talk to draco: {question}"})
     answer1 = r1.json()["reply"][0]["text"]
     
-    time.sleep(0.5)  # Small delay
-    
-    r2 = requests.post(f"{BASE}/session/action", json={"session_id": sid, "text": f"talk to draco: {question}"})
+    r2 = await client.post("/session/action", json={"session_id": sid, "text": f"talk to draco: {question}"})
     answer2 = r2.json()["reply"][0]["text"]
     
     if answer1 == answer2:
-        print("   ✅ PASS: Consistent answers (cache working)")
-        print(f"      Answer: '{answer1[:60]}...'")
+        log("   ✅ PASS: Consistent answers (cache working)")
+        log(f"      Answer: '{answer1[:60]}...'")
         return True
     else:
-        print(f"   ❌ FAIL: Inconsistent answers")
-        print(f"      First:  '{answer1[:60]}...'")
-        print(f"      Second: '{answer2[:60]}...'")
+        log(f"   ❌ FAIL: Inconsistent answers")
+        log(f"      First:  '{answer1[:60]}...'")
+        log(f"      Second: '{answer2[:60]}...'")
         return False
 
 
-def test_knowledge_boundaries():
+async def test_knowledge_boundaries(client: httpx.AsyncClient, log=print):
     """Test 2: NPCs respect knowledge constraints"""
-    print("\n🧪 Test 2: Knowledge Boundary Test")
-    print("   Testing if Evelyn claims certainty she shouldn't have...")
+    log("\n🧪 Test 2: Knowledge Boundary Test")
+    log("   Testing if Evelyn claims certainty she shouldn't have...")
     
-    resp = requests.post(f"{BASE}/session/start")
+    resp = await client.post("/session/start")
     sid = resp.json()["session_id"]
     
     # Ask Evelyn who's guilty (she suspects but doesn't KNOW)
-    r = requests.post(f"{BASE}/session/action", json={"session_id": sid, "text": "talk to evelyn: who stole the compass?"})
+    r = await client.post("/session/action", json={"session_id": sid, "text": "talk to evelyn: who stole the compass?"})
     answer = r.json()["reply"][0]["text"].lower()
     
     # She shouldn't definitively accuse
     violations = ["draco is guilty", "draco definitely", "draco took it", "draco stole it"]
     
     if any(v in answer for v in violations):
-        print(f"   ❌ FAIL: Evelyn claims certainty (knowledge violation)")
-        print(f"      Answer: '{answer}'")
+        log(f"   ❌ FAIL: Evelyn claims certainty (knowledge violation)")
+        log(f"      Answer: '{answer}'")
         return False
     else:
-        print("   ✅ PASS: Evelyn stays within knowledge bounds")
-        print(f"      Answer: '{answer[:60]}...'")
+        log("   ✅ PASS: Evelyn stays within knowledge bounds")
+        log(f"      Answer: '{answer[:60]}...'")
         return True
 
 
-def test_progression():
+async def test_progression(client: httpx.AsyncClient, log=print):
     """Test 3: Evidence-based revelation"""
-    print("\n🧪 Test 3: Progression Test")
-    print("   Testing if Draco only confesses with sufficient evidence...")
+    log("\n🧪 Test 3: Progression Test")
+    log("   Testing if Draco only confesses with sufficient evidence...")
     
-    resp = requests.post(f"{BASE}/session/start")
+    resp = await client.post("/session/start")
     sid = resp.json()["session_id"]
     
     # Phase 1: Ask without evidence
-    print("   Phase 1: No evidence collected")
-    r1 = requests.post(f"{BASE}/session/action", json={"session_id": sid, "text": "talk to draco: did you steal the compass?"})
+    log("   Phase 1: No evidence collected")
+    r1 = await client.post("/session/action", json={"session_id": sid, "text": "talk to draco: did you steal the compass?"})
     answer1 = r1.json()["reply"][0]["text"].lower()
     
     # He shouldn't confess yet
@@ -85,124 +87,115 @@ def test_progression():
     confessed_early = any(kw in answer1 for kw in confession_keywords)
     
     if confessed_early:
-        print(f"   ❌ FAIL: Draco confessed without evidence")
-        print(f"      Answer: '{answer1}'")
+        log(f"   ❌ FAIL: Draco confessed without evidence")
+        log(f"      Answer: '{answer1}'")
         return False
     else:
-        print(f"   ✅ Good: Draco is defensive without evidence")
-        print(f"      Answer: '{answer1[:60]}...'")
+        log(f"   ✅ Good: Draco is defensive without evidence")
+        log(f"      Answer: '{answer1[:60]}...'")
     
     # Phase 2: Collect evidence
-    print("   Phase 2: Collecting 3 pieces of evidence...")
-    requests.post(f"{BASE}/session/action", json={"session_id": sid, "text": "inspect shimmer"})
-    print("      - Found shimmer (1/3)")
+    log("   Phase 2: Collecting 3 pieces of evidence...")
+    await client.post("/session/action", json={"session_id": sid, "text": "inspect shimmer"})
+    log("      - Found shimmer (1/3)")
     
-    requests.post(f"{BASE}/session/action", json={"session_id": sid, "text": "go to library"})
-    requests.post(f"{BASE}/session/action", json={"session_id": sid, "text": "inspect torn page"})
-    print("      - Found torn page (2/3)")
+    await client.post("/session/action", json={"session_id": sid, "text": "go to library"})
+    await client.post("/session/action", json={"session_id": sid, "text": "inspect torn page"})
+    log("      - Found torn page (2/3)")
     
-    requests.post(f"{BASE}/session/action", json={"session_id": sid, "text": "inspect dropped key"})
-    print("      - Found dropped key (3/3)")
+    await client.post("/session/action", json={"session_id": sid, "text": "inspect dropped key"})
+    log("      - Found dropped key (3/3)")
     
     # Phase 3: Ask again with 3 evidence
-    print("   Phase 3: Confronting Draco with 3+ evidence")
-    time.sleep(0.5)
-    r2 = requests.post(f"{BASE}/session/action", json={"session_id": sid, "text": "talk to draco: did you steal the compass?"})
+    log("   Phase 3: Confronting Draco with 3+ evidence")
+    r2 = await client.post("/session/action", json={"session_id": sid, "text": "talk to draco: did you steal the compass?"})
     answer2 = r2.json()["reply"][0]["text"].lower()
     
     # Now he should confess
     confessed_now = any(kw in answer2 for kw in confession_keywords)
     
     if confessed_now:
-        print("   ✅ PASS: Draco confesses with sufficient evidence")
-        print(f"      Answer: '{answer2[:60]}...'")
+        log("   ✅ PASS: Draco confesses with sufficient evidence")
+        log(f"      Answer: '{answer2[:60]}...'")
         return True
     else:
-        print("   ❌ FAIL: Draco didn't confess despite evidence")
-        print(f"      Answer: '{answer2}'")
+        log("   ❌ FAIL: Draco didn't confess despite evidence")
+        log(f"      Answer: '{answer2}'")
         return False
 
 
-def get_report():
+async def run_test(name: str, test: Callable[..., Awaitable[bool]],
+                   client: httpx.AsyncClient) -> Tuple[str, bool, List[str]]:
+    """Run one test, buffering its output so concurrent tests don't interleave."""
+    lines: List[str] = []
+    try:
+        passed = await test(client, log=lines.append)
+    except Exception as e:
+        lines.append(f"   ❌ ERROR: {e}")
+        passed = False
+    return name, passed, lines
+
+
+def _fmt_section(title: str, section: dict, score_key: str) -> str:
+    """Format one Test → Measurements → Metric section of the report."""
+    metric = section['metric']
+    lines = [
+        f"\n{'─'*70}",
+        f"{title} (Tests → Measurements → Metric)",
+        f"{'─'*70}",
+        f"Test:        {section['test']}",
+        "Measurements:",
+    ]
+    lines += [f"  • {k}: {v}" for k, v in section['measurements'].items()]
+    lines.append(f"Metric:      {metric[score_key]} (threshold: {metric['pass_threshold']})")
+    lines.append(f"Status:      {'✅ PASS' if metric['passed'] else '❌ FAIL'}")
+    return "\n".join(lines)
+
+
+async def get_report(client: httpx.AsyncClient):
     """Get and display evaluation report"""
-    print("\n" + "="*70)
-    print("📊 EVALUATION REPORT")
-    print("="*70)
-    
-    r = requests.get(f"{BASE}/evaluation/report")
+    r = await client.get("/evaluation/report")
     report = r.json()
-    
-    print(f"\n📈 Total Interactions: {report['total_interactions']}")
-    
-    # Story Consistency
-    print(f"\n{'─'*70}")
-    print("📖 STORY CONSISTENCY (Tests → Measurements → Metric)")
-    print(f"{'─'*70}")
-    sc = report['story_consistency']
-    print(f"Test:        {sc['test']}")
-    print(f"Measurements:")
-    for k, v in sc['measurements'].items():
-        print(f"  • {k}: {v}")
-    print(f"Metric:      {sc['metric']['score']} (threshold: {sc['metric']['pass_threshold']})")
-    status = "✅ PASS" if sc['metric']['passed'] else "❌ FAIL"
-    print(f"Status:      {status}")
-    
-    # Response Quality
-    print(f"\n{'─'*70}")
-    print("⭐ RESPONSE QUALITY (Tests → Measurements → Metric)")
-    print(f"{'─'*70}")
-    rq = report['response_quality']
-    print(f"Test:        {rq['test']}")
-    print(f"Measurements:")
-    for k, v in rq['measurements'].items():
-        print(f"  • {k}: {v}")
-    print(f"Metric:      {rq['metric']['score']} (threshold: {rq['metric']['pass_threshold']})")
-    status = "✅ PASS" if rq['metric']['passed'] else "❌ FAIL"
-    print(f"Status:      {status}")
-    
-    # Mystery Progression
-    print(f"\n{'─'*70}")
-    print("🎯 MYSTERY PROGRESSION (Tests → Measurements → Metric)")
-    print(f"{'─'*70}")
-    mp = report['mystery_progression']
-    print(f"Test:        {mp['test']}")
-    print(f"Measurements:")
-    for k, v in mp['measurements'].items():
-        print(f"  • {k}: {v}")
-    print(f"Metric:      {mp['metric']['score']} (threshold: {mp['metric']['pass_threshold']})")
-    status = "✅ PASS" if mp['metric']['passed'] else "❌ FAIL"
-    print(f"Status:      {status}")
-    
-    # Overall
-    print(f"\n{'='*70}")
-    print("🎊 OVERALL ACCURACY")
-    print(f"{'='*70}")
     overall = report['overall']
-    print(f"Accuracy:    {overall['accuracy']} (threshold: {overall['pass_threshold']})")
-    status = "🎉 PASS - System is working well!" if overall['passed'] else "💥 FAIL - Needs improvement"
-    print(f"Status:      {status}")
-    
-    # Cache Performance
-    print(f"\n{'─'*70}")
-    print("💾 CACHE PERFORMANCE")
-    print(f"{'─'*70}")
-    cache = report['cache']
-    print(f"Cache Hits:  {cache['hits']}")
-    print(f"Cache Miss:  {cache['misses']}")
-    print(f"Hit Rate:    {cache['rate']:.1%}")
-    print(f"Cache Size:  {cache['size']} entries")
+    cache = report['cache_performance']
+    hit_rate = cache['hit_rate']
     
-    if cache['rate'] >= 0.4:
-        print(f"             ✅ Good hit rate (40%+)")
-    elif cache['rate'] >= 0.2:
-        print(f"             ⚠️  Fair hit rate (20-40%)")
+    if hit_rate >= 0.4:
+        rate_note = "✅ Good hit rate (40%+)"
+    elif hit_rate >= 0.2:
+        rate_note = "⚠️  Fair hit rate (20-40%)"
     else:
-        print(f"             ❌ Low hit rate (<20%)")
+        rate_note = "❌ Low hit rate (<20%)"
+    
+    # Build the whole report first and write it in one go
+    sections = [
+        "\n" + "="*70,
+        "📊 EVALUATION REPORT",
+        "="*70,
+        f"\n📈 Total Interactions: {report['total_interactions']}",
+        _fmt_section("📖 STORY CONSISTENCY", report['story_consistency'], "consistency_score"),
+        _fmt_section("⭐ RESPONSE QUALITY", report['response_quality'], "quality_score"),
+        _fmt_section("🎯 MYSTERY PROGRESSION", report['mystery_progression'], "progression_score"),
+        f"\n{'='*70}",
+        "🎊 OVERALL ACCURACY",
+        "="*70,
+        f"Accuracy:    {overall['accuracy']} (threshold: {overall['pass_threshold']})",
+        f"Status:      {'🎉 PASS - System is working well!' if overall['passed'] else '💥 FAIL - Needs improvement'}",
+        f"\n{'─'*70}",
+        "💾 CACHE PERFORMANCE",
+        "─"*70,
+        f"Cache Hits:  {cache['cache_hits']}",
+        f"Cache Miss:  {cache['cache_misses']}",
+        f"Hit Rate:    {hit_rate:.1%}",
+        f"Cache Size:  {cache['cached_entries']} entries",
+        f"             {rate_note}",
+    ]
+    print("\n".join(sections))
     
     return overall['passed']
 
 
-def main():
+async def main():
     print("="*70)
     print("🧙‍♂️  HOGWARTS MYSTERY - AUTOMATED TEST SUITE")
     print("="*70)
@@ -212,9 +205,16 @@ def main():
     print("  3. Evidence-based progression (mystery reveals appropriately)")
     print("\n" + "─"*70)
     
+    transport = httpx.AsyncHTTPTransport(limits=POOL_LIMITS, retries=0)
+    async with httpx.AsyncClient(base_url=BASE, transport=transport, timeout=60,
+                                 headers={"Connection": "keep-alive"}) as client:
+        await run_suite(client)
+
+
+async def run_suite(client: httpx.AsyncClient):
     # Check backend is running
     try:
-        r = requests.get(f"{BASE}/")
+        r = await client.get("/")
         print(f"✅ Backend connected: {r.json()['message']}")
     except Exception as e:
         print(f"❌ ERROR: Cannot connect to backend at {BASE}")
@@ -225,31 +225,21 @@ def main():
     
     # Reset metrics
     try:
-        requests.post(f"{BASE}/evaluation/reset")
+        await client.post("/evaluation/reset")
         print("🔄 Evaluation metrics reset\n")
     except:
         print("⚠️  Could not reset metrics (endpoint may not exist)\n")
     
-    # Run tests
+    # Run tests concurrently; each uses its own session, so they share no state
+    outcomes = await asyncio.gather(
+        run_test("Consistency", test_consistency, client),
+        run_test("Knowledge Boundaries", test_knowledge_boundaries, client),
+        run_test("Progression", test_progression, client),
+    )
     results = []
-    
-    try:
-        results.append(("Consistency", test_consistency()))
-    except Exception as e:
-        print(f"   ❌ ERROR: {e}")
-        results.append(("Consistency", False))
-    
-    try:
-        results.append(("Knowledge Boundaries", test_knowledge_boundaries()))
-    except Exception as e:
-        print(f"   ❌ ERROR: {e}")
-        results.append(("Knowledge Boundaries", False))
-    
-    try:
-        results.append(("Progression", test_progression()))
-    except Exception as e:
-        print(f"   ❌ ERROR: {e}")
-        results.append(("Progression", False))
+    for name, passed, lines in outcomes:
+        print("\n".join(lines))
+        results.append((name, passed))
     
     # Test summary
     print("\n" + "="*70)
@@ -271,7 +261,7 @@ def main():
     
     # Get evaluation report
     try:
-        overall_passed = get_report()
+        overall_passed = await get_report(client)
         
         print("\n" + "="*70)
         if overall_passed:
@@ -285,4 +275,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file